@@ -1,16 +1,60 @@
 import os
+import re
 import sys
+import json
+import tempfile
+import time
+import threading
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import zipfile
 import io
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Set, Tuple
+from urllib.parse import urlparse
+
+# Matches the font URLs in the @font-face rules returned by Google Fonts
+_FONT_URL_RE = re.compile(r"url\(\s*['\"]?(https?://[^)'\"]+)['\"]?\s*\)")
+# Preferred font formats, best first. PyMuPDF can only embed TrueType/OpenType
+# fonts, so those are picked ahead of the smaller web formats.
+_FONT_FORMAT_PREFERENCE = (".ttf", ".otf", ".woff2", ".woff")
+# How long a font reported missing by Google Fonts is skipped before being retried (seconds)
+_MISSING_FONT_TTL = 7 * 24 * 60 * 60
 
 class FontManager:
     """Manages font discovery and downloading for the PDF Editor."""
-    def __init__(self, verbose: bool = False):
+    # Index of system fonts shared by all instances, prefetched in the background.
+    # Maps normalized font file names (lowercase, no spaces, no extension) to paths.
+    _font_index: Optional[Dict[str, str]] = None
+    # Modification times of every directory walked when the index was built
+    # (None for font directories that didn't exist)
+    _font_index_mtimes: Optional[Dict[str, Optional[float]]] = None
+    # Normalized names of fonts that were neither installed nor available on Google Fonts,
+    # mapped to the time Google Fonts reported them missing
+    _missing: Dict[str, float] = {}
+    # Serializes every change to the shared index, its missing fonts and the cache
+    # file across threads and instances (reentrant, as updates save the cache)
+    _index_lock = threading.RLock()
+
+    def __init__(self, verbose: bool = False, prefetch: bool = True):
         self.verbose = verbose
         self.font_extensions = [".ttf", ".otf", ".woff", ".woff2"]
+        # Contents of font files already read from disk, keyed by path
+        self._loaded_fonts: Dict[str, bytes] = {}
+        # Shared session so repeated downloads reuse pooled keep-alive connections
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self.cache_path = Path(self.get_cache_directory()) / "pdf_edit_font_index.json"
+        # Load or build the font index in the background so the first lookup
+        # doesn't have to wait for the font directories to be walked
+        self._index_thread = None
+        if prefetch:
+            self._index_thread = threading.Thread(target=self._prefetch_index, daemon=True)
+            self._index_thread.start()
 
     def set_verbose(self, verbose):
         """Set verbose mode for detailed output."""
@@ -37,32 +81,235 @@ class FontManager:
                 os.path.expanduser("~/.local/share/fonts"),
             ]
 
+    def get_cache_directory(self) -> str:
+        """Get the user cache directory based on the operating system."""
+        if sys.platform == "win32":
+            return os.path.join(os.environ["LOCALAPPDATA"], "pdf_edit", "Cache")
+        elif sys.platform == "darwin":
+            return os.path.expanduser("~/Library/Caches/pdf_edit")
+        else:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+            return os.path.join(cache_home, "pdf_edit")
+
     def find_font_in_system(self, font_name: str) -> Optional[str]:
         """Search for a font in system directories."""
-        font_dirs = self.get_system_font_dirs()
-        
+        font_index = self._get_font_index()
+        return self._match_font(font_index, font_name.lower().replace(" ", ""))
+
+    @staticmethod
+    def _match_font(font_index: Dict[str, str], font_key: str) -> Optional[str]:
+        """Look up a normalized font name in the index, exactly or as part of a file name."""
+        font_path = font_index.get(font_key)
+        if font_path:
+            return font_path
+
+        # Fall back to a partial match (e.g. "Roboto" -> "Roboto-Regular.ttf")
+        for name, path in font_index.items():
+            if font_key in name:
+                return path
+        return None
+
+    def _get_font_dir_mtimes(self, font_dirs: Optional[List[str]] = None) -> Dict[str, Optional[float]]:
+        """Get the modification time of each font directory (None if missing)."""
+        if font_dirs is None:
+            font_dirs = self.get_system_font_dirs()
+        mtimes = {}
         for font_dir in font_dirs:
-            if not os.path.exists(font_dir):
+            try:
+                mtimes[font_dir] = os.stat(font_dir).st_mtime
+            except OSError:
+                mtimes[font_dir] = None
+        return mtimes
+
+    def _get_font_index(self) -> Dict[str, str]:
+        """Return the system font index, rebuilding it if the font directories changed."""
+        # Wait for the prefetch started in __init__, if it is still running
+        if self._index_thread is not None:
+            self._index_thread.join()
+        return self._refresh_font_index()
+
+    def _refresh_font_index(self) -> Dict[str, str]:
+        """Load the font index from the cache, rebuilding it if it is missing or stale."""
+        with FontManager._index_lock:
+            if FontManager._font_index is None:
+                # The saved index may be from long ago, so check every directory it saw
+                stale = not self._load_index_cache() or self._index_is_stale(deep=True)
+            else:
+                # Within a process only the font directories themselves are checked,
+                # which keeps lookups to a handful of stat calls
+                stale = self._index_is_stale()
+            if stale:
+                self._build_index()
+            return FontManager._font_index
+
+    def _index_is_stale(self, deep: bool = False) -> bool:
+        """
+        Check whether the font directories changed since the index was built.
+        
+        Args:
+            deep: Also check every subdirectory seen by the last walk. Fonts installed
+                into a new subdirectory only change the mtime of its parent, which may
+                be several levels below the font directory itself.
+        """
+        recorded = FontManager._font_index_mtimes or {}
+        font_dirs = self.get_system_font_dirs()
+        if deep:
+            font_dirs = list(dict.fromkeys(list(recorded) + font_dirs))
+        current = self._get_font_dir_mtimes(font_dirs)
+        return any(recorded.get(font_dir) != mtime for font_dir, mtime in current.items())
+
+    def _prefetch_index(self) -> None:
+        """Prepare the font index ahead of the first lookup."""
+        try:
+            self._refresh_font_index()
+        except Exception as e:
+            if self.verbose:
+                print(f"Error prefetching font index: {e}")
+
+    def _build_index(self) -> Dict[str, str]:
+        """Walk the system font directories once and index every font file found."""
+        # Split the walk into one task per font directory (top-level files only)
+        # plus one per subdirectory, so large trees are listed concurrently
+        tasks = []
+        mtimes = {}
+        for font_dir in self.get_system_font_dirs():
+            if not os.path.isdir(font_dir):
+                mtimes[font_dir] = None
                 continue
-                
-            font_path = self._search_font_in_directory(font_dir, font_name)
-            if font_path:
-                return font_path
-        return None
+            tasks.append((font_dir, False))
+            try:
+                with os.scandir(font_dir) as entries:
+                    for entry in entries:
+                        if entry.is_dir() and not entry.is_symlink():
+                            tasks.append((entry.path, True))
+            except OSError:
+                continue
+
+        # Lowercase extensions without the dot, matched against the text after the last "."
+        extensions = frozenset(ext.lstrip(".").lower() for ext in self.font_extensions)
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+            partial_indexes = list(executor.map(
+                lambda task: self._index_font_directory(task[0], extensions, task[1]), tasks
+            ))
+
+        # Merge in task order so the first match wins, as the previous directory search did
+        font_index = {}
+        for partial_index, partial_mtimes in partial_indexes:
+            for name, path in partial_index.items():
+                font_index.setdefault(name, path)
+            mtimes.update(partial_mtimes)
+
+        if self.verbose:
+            print(f"Indexed {len(font_index)} system fonts")
 
-    def _search_font_in_directory(self, directory: str, font_name: str) -> Optional[str]:
-        """Search for a font file in a specific directory and its subdirectories."""
-        font_name_lower = font_name.lower().replace(" ", "")
+        FontManager._font_index = font_index
+        FontManager._font_index_mtimes = mtimes
+        # Forget missing fonts that have been installed since they were recorded
+        FontManager._missing = {
+            name: marked_at for name, marked_at in FontManager._missing.items()
+            if self._match_font(font_index, name) is None
+        }
+        self._save_index_cache()
+        return font_index
+
+    def _add_to_index(self, font_path: str) -> None:
+        """Add a downloaded font to the index without walking the font directories again."""
+        with FontManager._index_lock:
+            if FontManager._font_index is None:
+                return
+            name = os.path.splitext(os.path.basename(font_path))[0]
+            FontManager._font_index.setdefault(name.lower().replace(" ", ""), font_path)
+            # Saving the font changed its directory's mtime; record it so the
+            # index isn't considered stale because of this download
+            FontManager._font_index_mtimes.update(
+                self._get_font_dir_mtimes([os.path.dirname(font_path)])
+            )
+            self._save_index_cache()
+
+    def _load_index_cache(self) -> bool:
+        """Load the font index saved by a previous run, if there is one."""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            if cache.get("platform") != sys.platform:
+                return False
+            FontManager._font_index = dict(cache["index"])
+            FontManager._font_index_mtimes = dict(cache["dirs"])
+            FontManager._missing = {
+                name: float(marked_at) for name, marked_at in cache.get("missing", {}).items()
+            }
+            return True
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # A missing or corrupt cache just means the index gets rebuilt
+            return False
+
+    def _save_index_cache(self) -> bool:
+        """Save the font index to the cache file, replacing it atomically."""
+        with FontManager._index_lock:
+            cache = {
+                "platform": sys.platform,
+                "dirs": FontManager._font_index_mtimes,
+                "index": FontManager._font_index,
+                "missing": FontManager._missing,
+            }
+            try:
+                os.makedirs(self.cache_path.parent, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_path.parent, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(cache, f)
+                    os.replace(tmp_path, self.cache_path)
+                except Exception:
+                    os.remove(tmp_path)
+                    raise
+                return True
+            except Exception as e:
+                if self.verbose:
+                    print(f"Error saving font index cache: {e}")
+                return False
+
+    def _index_font_directory(
+        self, directory: str, extensions: Set[str], recursive: bool = True
+    ) -> Tuple[Dict[str, str], Dict[str, Optional[float]]]:
+        """
+        Index the font files in a directory and, if recursive, its subdirectories.
         
-        for root, _, files in os.walk(directory):
-            for file in files:
-                file_lower = file.lower()
-                if any(
-                    font_name_lower in file_lower and file_lower.endswith(ext)
-                    for ext in self.font_extensions
-                ):
-                    return os.path.join(root, file)
-        return None
+        Returns:
+            The font index and the modification time of every directory walked
+        """
+        font_index = {}
+        mtimes = {}
+        # os.scandir exposes the entry type without the extra stat calls os.walk makes
+        stack = [directory]
+        while stack:
+            current_dir = stack.pop()
+            try:
+                # Stat before listing so a change made during the walk marks the index stale
+                mtimes[current_dir] = os.stat(current_dir).st_mtime
+                with os.scandir(current_dir) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(entry.path)
+                            continue
+                        name, _, ext = entry.name.rpartition(".")
+                        # Most font files already have lowercase extensions, so only
+                        # lowercase the extension when the direct lookup misses
+                        if name and (ext in extensions or ext.lower() in extensions):
+                            font_index.setdefault(name.lower().replace(" ", ""), entry.path)
+            except OSError:
+                mtimes.setdefault(current_dir, None)
+                continue
+        return font_index, mtimes
+
+    def get_font_buffer(self, font_path: str) -> bytes:
+        """Get the contents of a font file, reading it from disk only the first time."""
+        font_buffer = self._loaded_fonts.get(font_path)
+        if font_buffer is None:
+            with open(font_path, "rb") as f:
+                font_buffer = f.read()
+            self._loaded_fonts[font_path] = font_buffer
+        return font_buffer
 
     def get_font_save_directory(self) -> str:
         """Get the appropriate directory for saving downloaded fonts."""
@@ -90,10 +337,14 @@ class FontManager:
             api_url = f"https://fonts.googleapis.com/css?family={api_font_name}"
             
             # Get the CSS containing the font file URL
-            css_response = requests.get(api_url)
+            css_response = self._session.get(api_url)
             if css_response.status_code != 200:
                 if self.verbose:
                     print(f"Could not find font '{font_name}' on Google Fonts")
+                # Only a client error means the family doesn't exist; server errors
+                # (and network failures below) may succeed on a later attempt
+                if 400 <= css_response.status_code < 500:
+                    self._mark_missing([font_name])
                 return None
             
             font_url = self._extract_font_url(css_response.text)
@@ -101,45 +352,73 @@ class FontManager:
                 return None
             
             # Download the font file
-            return self._save_font_file(font_name, font_url)
+            font_path = self._save_font_file(font_name, font_url)
+            if font_path:
+                self._add_to_index(font_path)
+            return font_path
             
         except Exception as e:
             if self.verbose:
                 print(f"Error downloading font: {e}")
             return None
 
+    def download_google_fonts(self, font_names: List[str], max_workers: int = 8) -> Dict[str, Optional[str]]:
+        """Download several fonts from Google Fonts concurrently."""
+        font_names = list(dict.fromkeys(font_names))
+        if not font_names:
+            return {}
+        
+        # Downloads are network-bound, so threads sharing the pooled session keep
+        # all the requests in flight at once
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(font_names))) as executor:
+            return dict(zip(font_names, executor.map(self.download_google_font, font_names)))
+
     def _extract_font_url(self, css_content: str) -> Optional[str]:
-        """Extract the font URL from Google Fonts CSS content."""
-        url_start = css_content.find("url(") + 4
-        url_end = css_content.find(")", url_start)
+        """Extract the font URL from Google Fonts CSS content, picking the preferred format."""
+        font_urls = _FONT_URL_RE.findall(css_content)
         
-        if url_start < 4 or url_end < 0:
+        if not font_urls:
             if self.verbose:
                 print("Could not parse font URL from Google Fonts CSS")
             return None
-            
-        return css_content[url_start:url_end]
+        
+        def format_rank(font_url: str) -> int:
+            ext = os.path.splitext(urlparse(font_url).path)[1].lower()
+            if ext in _FONT_FORMAT_PREFERENCE:
+                return _FONT_FORMAT_PREFERENCE.index(ext)
+            return len(_FONT_FORMAT_PREFERENCE)
+        
+        # min() keeps the first URL among those of the same format
+        return min(font_urls, key=format_rank)
 
     def _save_font_file(self, font_name: str, font_url: str) -> Optional[str]:
         """Download and save a font file from a URL."""
         try:
-            font_response = requests.get(font_url)
-            if font_response.status_code != 200:
-                if self.verbose:
-                    print(f"Failed to download font from {font_url}")
-                return None
-            
-            # Determine save location and extension
-            font_save_dir = self.get_font_save_directory()
-            os.makedirs(font_save_dir, exist_ok=True)
-            
-            ext = self.get_font_extension(font_response.headers.get("Content-Type", ""))
-            safe_font_name = font_name.replace(" ", "_")
-            font_path = os.path.join(font_save_dir, f"{safe_font_name}{ext}")
-            
-            # Save the font file
-            with open(font_path, "wb") as f:
-                f.write(font_response.content)
+            # Stream the response so the font is written to disk without buffering it in memory
+            with self._session.get(font_url, stream=True) as font_response:
+                if font_response.status_code != 200:
+                    if self.verbose:
+                        print(f"Failed to download font from {font_url}")
+                    return None
+                
+                # Determine save location and extension
+                font_save_dir = self.get_font_save_directory()
+                os.makedirs(font_save_dir, exist_ok=True)
+                
+                ext = self.get_font_extension(font_response.headers.get("Content-Type", ""))
+                safe_font_name = font_name.replace(" ", "_")
+                font_path = os.path.join(font_save_dir, f"{safe_font_name}{ext}")
+                
+                # Save the font file
+                font_response.raw.decode_content = True
+                try:
+                    with open(font_path, "wb") as f:
+                        shutil.copyfileobj(font_response.raw, f, length=64 * 1024)
+                except Exception:
+                    # Don't leave a truncated font behind for the index to pick up
+                    if os.path.exists(font_path):
+                        os.remove(font_path)
+                    raise
             
             if self.verbose:
                 print(f"Downloaded and saved font to: {font_path}")
@@ -160,6 +439,12 @@ class FontManager:
         Returns:
             Path to the font file if found or downloaded successfully, None otherwise
         """
+        # Skip fonts already known to be unavailable
+        if self._is_known_missing(font_name):
+            if self.verbose:
+                print(f"Font '{font_name}' previously not found, skipping search")
+            return None
+
         # First try to find the font in the system
         font_path = self.find_font_in_system(font_name)
         if font_path:
@@ -171,3 +456,53 @@ class FontManager:
         if self.verbose:
             print(f"Font '{font_name}' not found on system. Attempting to download...")
         return self.download_google_font(font_name)
+
+    def find_fonts(self, font_names: List[str], max_workers: int = 8) -> Dict[str, Optional[str]]:
+        """
+        Find several fonts at once, downloading the missing ones from Google Fonts in parallel.
+        
+        Args:
+            font_names: Names of the fonts to search for
+            max_workers: Maximum number of concurrent downloads
+            
+        Returns:
+            Dictionary mapping each font name to its font file path, or None if not found
+        """
+        results = {}
+        to_download = []
+        for font_name in dict.fromkeys(font_names):
+            if self._is_known_missing(font_name):
+                results[font_name] = None
+                continue
+            font_path = self.find_font_in_system(font_name)
+            if font_path:
+                results[font_name] = font_path
+            else:
+                to_download.append(font_name)
+
+        if to_download:
+            if self.verbose:
+                print(f"Fonts not found on system: {to_download}. Attempting to download...")
+            results.update(self.download_google_fonts(to_download, max_workers))
+
+        return results
+
+    def _is_known_missing(self, font_name: str) -> bool:
+        """Check whether Google Fonts recently reported a font as unavailable."""
+        # The saved missing fonts come with the index, so only load it if needed; a hit
+        # returns without checking the font directories, a miss is left to the lookup
+        if self._index_thread is not None:
+            self._index_thread.join()
+        if FontManager._font_index is None:
+            self._get_font_index()
+        marked_at = FontManager._missing.get(font_name.lower().replace(" ", ""))
+        return marked_at is not None and time.time() - marked_at < _MISSING_FONT_TTL
+
+    def _mark_missing(self, font_names: List[str]) -> None:
+        """Record fonts that are neither installed nor available on Google Fonts."""
+        if not font_names:
+            return
+        marked_at = time.time()
+        with FontManager._index_lock:
+            FontManager._missing.update((name.lower().replace(" ", ""), marked_at) for name in font_names)
+            self._save_index_cache()
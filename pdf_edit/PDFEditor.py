@@ -1,9 +1,32 @@
-import PyPDF2
 from .FontManager import FontManager
 import fitz
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 
+# PDF base-14 font names, as reported in text spans, mapped to PyMuPDF's built-in fonts
+BASE14_FONTS = {
+    'Helvetica': 'helv',
+    'Helvetica-Oblique': 'heit',
+    'Helvetica-Bold': 'hebo',
+    'Helvetica-BoldOblique': 'hebi',
+    'Times-Roman': 'tiro',
+    'Times-Italic': 'tiit',
+    'Times-Bold': 'tibo',
+    'Times-BoldItalic': 'tibi',
+    'Courier': 'cour',
+    'Courier-Oblique': 'coit',
+    'Courier-Bold': 'cobo',
+    'Courier-BoldOblique': 'cobi',
+    'Symbol': 'symb',
+    'ZapfDingbats': 'zadb',
+}
+
+# Built-in fonts in PyMuPDF
+BUILTIN_FONTS = frozenset(BASE14_FONTS.values())
+
+# Default options for saving edited PDFs: compress streams and drop unused objects
+DEFAULT_SAVE_OPTIONS = {'deflate': True, 'garbage': 4, 'clean': True}
+
 class PDFEditor:
     def __init__(self):
         self.current_pdf = None
@@ -12,6 +35,8 @@ class PDFEditor:
         self.filename = None
         self.verbose = False
         self.FontManager = FontManager(verbose=False)
+        # Font file paths already resolved by the FontManager (None if known to be missing)
+        self._font_resolution_cache = {}
 
     def set_verbose(self, verbose):
         """Set verbose mode for detailed output."""
@@ -21,7 +46,9 @@ class PDFEditor:
     def open_pdf(self, pdf_path):
         """Open a PDF file for editing."""
         try:
-            self.current_pdf = PyPDF2.PdfReader(pdf_path)
+            # Keep the PyMuPDF document open so successive edits don't re-parse the file
+            self.close()
+            self.current_pdf = fitz.open(pdf_path)
             self.filename = pdf_path
             self.page_number = 0
             return True
@@ -31,30 +58,94 @@ class PDFEditor:
 
     def get_page_text(self, page_number):
         """Extract text from a specific page."""
-        if not self.current_pdf:
+        if self.current_pdf is None:
             return None
         
         try:
-            page = self.current_pdf.pages[page_number]
-            return page.extract_text()
+            page = self.current_pdf[page_number]
+            return page.get_text()
         except Exception as e:
             print(f"Error extracting text: {str(e)}")
             return None
 
     def redact_text(self, page, text_instance):
         """Remove the original text using redaction."""
+        return self.add_redaction(page, text_instance) and self.apply_redactions(page)
+
+    def add_redaction(self, page, text_instance):
+        """Mark the original text for removal without applying the redaction yet."""
+        try:
+            page.add_redact_annot(text_instance, "")
+            return True
+        except Exception as e:
+            print(f"Error redacting text: {str(e)}")
+            return False
+
+    def apply_redactions(self, page):
+        """Apply all pending redactions on a page in a single content rewrite."""
         try:
-            annot = page.add_redact_annot(text_instance, "")
             page.apply_redactions()
             return True
         except Exception as e:
             print(f"Error redacting text: {str(e)}")
             return False
         
-    def get_text_properties(self, page, text_instance):
+    def get_page_spans(self, page):
+        """Extract every text span on a page with its bounding rectangle, sorted top to bottom."""
+        spans = []
+        page_dict = page.get_text("dict")
+        for block in page_dict.get('blocks', []):
+            for line in block.get('lines', []):
+                for span in line.get('spans', []):
+                    spans.append((fitz.Rect(span['bbox']), span))
+        spans.sort(key=lambda item: (item[0].y0, item[0].x0))
+        return spans
+
+    def match_spans(self, text_instances, spans):
+        """
+        Find the span that overlaps each text instance the most.
+        
+        Both lists must be sorted top to bottom (by y0), so the spans can be
+        swept alongside the instances instead of being scanned for each one.
+        
+        Returns:
+            List with the matching span (or None) for each text instance
+        """
+        matches = []
+        start = 0
+        for inst in text_instances:
+            # Spans ending above this instance can't overlap it or any later one
+            while start < len(spans) and spans[start][0].y1 <= inst.y0:
+                start += 1
+            
+            best_span = None
+            best_area = 0
+            i = start
+            while i < len(spans) and spans[i][0].y0 < inst.y1:
+                span_rect, span = spans[i]
+                area = (span_rect & inst).get_area()
+                if area > best_area:
+                    best_span, best_area = span, area
+                i += 1
+            matches.append(best_span)
+        return matches
+
+    def get_text_properties(self, page, text_instance, spans=None):
         """Extract text properties (font, size, color, etc.) from the original text."""
         try:
-            font_info = page.get_text("dict", clip=text_instance)
+            # Parse the page once and reuse the spans for every instance if provided
+            if spans is None:
+                spans = self.get_page_spans(page)
+            span = self.match_spans([fitz.Rect(text_instance)], spans)[0]
+            return self.get_span_properties(span, text_instance)
+        except Exception as e:
+            if self.verbose:
+                print(f"Error getting text properties: {str(e)}")
+            return None
+
+    def get_span_properties(self, span, text_instance):
+        """Build the text properties of an instance from the span it belongs to."""
+        try:
             properties = {
                 'font': 'helv',  # default font
                 'size': 11,      # default size
@@ -62,33 +153,31 @@ class PDFEditor:
             }
             
             # Extract font properties if available
-            if isinstance(font_info, dict) and 'blocks' in font_info and font_info['blocks']:
-                try:
-                    span = font_info['blocks'][0]['lines'][0]['spans'][0]
-                    
-                    if 'font' in span:
-                        properties['font'] = span['font']
-                    elif self.verbose:
-                        print("Warning: Font information not found in span properties")
-                    
-                    if 'size' in span:
-                        properties['size'] = span['size']
-                    elif self.verbose:
-                        print("Warning: Font size not found in span properties")
-                    
-                    if 'color' in span:
-                        properties['color'] = span['color']
-                    elif self.verbose:
-                        print("Warning: Text color not found in span properties")
-                    
-                    if self.verbose:
-                        print(f"Extracted properties from span: {properties}")
-                        print(f"Raw span data: {span}")
-                    
-                except (IndexError, KeyError) as e:
-                    if self.verbose:
-                        print(f"Warning: Could not access span properties: {str(e)}")
-                        print(f"Raw font_info structure: {font_info}")
+            if span is not None:
+                if 'font' in span:
+                    # Use PyMuPDF's built-in font for base-14 fonts (subset or not)
+                    base_font = span['font'].split('+', 1)[-1]
+                    properties['font'] = BASE14_FONTS.get(base_font, span['font'])
+                elif self.verbose:
+                    print("Warning: Font information not found in span properties")
+                
+                if 'size' in span:
+                    properties['size'] = span['size']
+                elif self.verbose:
+                    print("Warning: Font size not found in span properties")
+                
+                if 'color' in span:
+                    # Spans store the color as an sRGB integer; PyMuPDF draws with RGB floats
+                    color = span['color']
+                    properties['color'] = fitz.sRGB_to_pdf(color) if isinstance(color, int) else color
+                elif self.verbose:
+                    print("Warning: Text color not found in span properties")
+                
+                if self.verbose:
+                    print(f"Extracted properties from span: {properties}")
+                    print(f"Raw span data: {span}")
+            elif self.verbose:
+                print(f"Warning: No text span found at {text_instance}")
                 
             return properties
         except Exception as e:
@@ -96,27 +185,39 @@ class PDFEditor:
                 print(f"Error getting text properties: {str(e)}")
             return None
 
+    def find_font(self, font_name):
+        """Find a font file, reusing the result of earlier lookups."""
+        if font_name in self._font_resolution_cache:
+            return self._font_resolution_cache[font_name]
+        font_path = self.FontManager.find_font(font_name)
+        self._remember_font(font_name, font_path)
+        return font_path
+
+    def _remember_font(self, font_name, font_path):
+        """Memoize a font lookup, unless it failed for a reason that may not last."""
+        # A None from a network failure shouldn't pin the font to Helvetica for good
+        if font_path or self.FontManager._is_known_missing(font_name):
+            self._font_resolution_cache[font_name] = font_path
+
     def insert_new_text(self, page, position, text, properties):
         """Insert new text with the original text properties."""
         try:
-            # Built-in fonts in PyMuPDF
-            builtin_fonts = {
-                'helv', 'tiro', 'cour', 'symb', 'zadb'
-            }
-            
             font_name = properties['font']
             
             # If font is already a built-in font, use it directly
-            if font_name in builtin_fonts:
+            if font_name in BUILTIN_FONTS:
                 use_font = font_name
             else:
                 # Try to get the actual font file
-                font_file = self.FontManager.find_font(font_name)
+                font_file = self.find_font(font_name)
                 
                 if font_file:
                     # Register the font with PyMuPDF
                     try:
-                        page.parent.load_font(font_file)
+                        page.insert_font(
+                            fontname=font_name,
+                            fontbuffer=self.FontManager.get_font_buffer(font_file)
+                        )
                         use_font = font_name  # Use the actual font name
                         
                         if self.verbose:
@@ -153,12 +254,29 @@ class PDFEditor:
                 print(f"Attempted font properties: {properties}")
             return False
     
-    def edit_text(self, page_number, old_text, new_text):
-        """Edit text while preserving formatting"""
+    def edit_text(self, page_number, old_text, new_text, incremental=False, save_kwargs=None):
+        """
+        Edit text while preserving formatting
+        
+        Args:
+            page_number: Index of the page to edit
+            old_text: Text to replace
+            new_text: Replacement text
+            incremental: Append the changes to the original file instead of
+                writing a new "_edited" copy
+            save_kwargs: Options passed to PyMuPDF's save, replacing
+                DEFAULT_SAVE_OPTIONS (ignored for incremental saves)
+            
+        Returns:
+            True if the edited document was saved, False otherwise
+        """
         
         try:
-            # Open the PDF with PyMuPDF
-            doc = fitz.open(self.filename)
+            # Reuse the PDF already opened with PyMuPDF
+            doc = self.current_pdf
+            if doc is None:
+                print("Error editing text with formatting: no PDF is open")
+                return False
             page = doc[page_number]
 
             # Find text instances on the page
@@ -167,13 +285,28 @@ class PDFEditor:
             if not text_instances and self.verbose:
                 print(f"Warning: Text '{old_text}' not found on page {page_number}")
             
-            # Replace each instance
-            for inst in text_instances:
-                # Get the original text properties
-                properties = self.get_text_properties(page, inst)
-                if not properties:
-                    continue
-                
+            # Process the instances top to bottom so they can be matched to the
+            # page's spans in a single sweep
+            text_instances.sort(key=lambda rect: (rect.y0, rect.x0))
+            
+            # Get the original text properties of every instance from a single page parse
+            spans = self.get_page_spans(page) if text_instances else []
+            instances = []
+            for inst, span in zip(text_instances, self.match_spans(text_instances, spans)):
+                properties = self.get_span_properties(span, inst)
+                if properties:
+                    instances.append((inst, properties))
+            
+            # Resolve all the fonts needed up front so downloads run in parallel
+            font_names = {properties['font'] for _, properties in instances}
+            font_names -= BUILTIN_FONTS | self._font_resolution_cache.keys()
+            if font_names:
+                for font_name, font_path in self.FontManager.find_fonts(sorted(font_names)).items():
+                    self._remember_font(font_name, font_path)
+            
+            # Mark every instance for redaction
+            replacements = []
+            for inst, properties in instances:
                 # Store rectangle information before redaction
                 original_rect = fitz.Rect(inst)
                 
@@ -182,10 +315,15 @@ class PDFEditor:
                     print(f"Top-left: {original_rect.tl}, Bottom-right: {original_rect.br}")
                     print(f"Width: {original_rect.width}, Height: {original_rect.height}")
                     
-                # Remove the original text
-                if not self.redact_text(page, inst):
-                    continue
-                
+                if self.add_redaction(page, inst):
+                    replacements.append((original_rect, properties))
+            
+            # Remove the original text, rewriting the page contents only once
+            if replacements and not self.apply_redactions(page):
+                replacements = []
+            
+            # Insert the new text at each redacted position
+            for original_rect, properties in replacements:
                 # TODO: actually find out a decent baseline_offset
                 font_size = properties['size']
                 baseline_offset = font_size + (font_size * 0.08)
@@ -201,8 +339,14 @@ class PDFEditor:
                     continue
             
             # Save the final modified document
-            output_path = self.filename.replace('.pdf', '_edited.pdf')
-            doc.save(output_path)
+            if incremental:
+                # Only the changed objects are appended to the original file
+                doc.save(self.filename, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+            else:
+                output_path = self.filename.replace('.pdf', '_edited.pdf')
+                if save_kwargs is None:
+                    save_kwargs = DEFAULT_SAVE_OPTIONS
+                self._save_copy(output_path, save_kwargs)
             return True
             
         except Exception as e:
@@ -211,17 +355,25 @@ class PDFEditor:
 
     def save_pdf(self, output_path):
         """Save the current PDF to a new file."""
-        if not self.current_pdf:
+        if self.current_pdf is None:
             return False
 
         try:
-            writer = PyPDF2.PdfWriter()
-            for page in self.current_pdf.pages:
-                writer.add_page(page)
-            
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
+            self._save_copy(output_path, DEFAULT_SAVE_OPTIONS)
             return True
         except Exception as e:
             print(f"Error saving PDF: {str(e)}")
             return False
+
+    def _save_copy(self, output_path, save_kwargs):
+        """Save the current PDF to a new file without altering the open document."""
+        # Options like garbage collection renumber the objects of the document
+        # being saved, after which incremental saves to the original file corrupt it
+        with fitz.open("pdf", self.current_pdf.tobytes()) as copy:
+            copy.save(output_path, **save_kwargs)
+
+    def close(self):
+        """Close the PDF opened for editing."""
+        if self.current_pdf is not None:
+            self.current_pdf.close()
+            self.current_pdf = None
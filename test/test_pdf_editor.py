@@ -3,27 +3,43 @@ import os
 import sys
 import tempfile
 import shutil
+import time
+import threading
+import json
+from unittest import mock
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import fitz
+import requests
 from pdf_edit.PDFEditor import PDFEditor
+from pdf_edit.FontManager import FontManager
 
 class TestPDFEditor(unittest.TestCase):
     def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_pdf_path = os.path.join(self.temp_dir, "example.pdf")
+        
+        # Keep the font index away from the user's cache and system fonts
+        env_patch = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(self.temp_dir, "cache")})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        dirs_patch = mock.patch.object(FontManager, "get_system_font_dirs", return_value=[])
+        dirs_patch.start()
+        self.addCleanup(dirs_patch.stop)
+        
         self.editor = PDFEditor()
-        self.test_pdf_path = "examples/example.pdf"
         
         # Create a test PDF file
-        if not os.path.exists(self.test_pdf_path):
-            self.create_test_pdf()
+        self.create_test_pdf()
 
     def tearDown(self):
-        # Clean up any edited PDFs that might have been created
-        edited_pdf = self.test_pdf_path.replace('.pdf', '_edited.pdf')
-        if os.path.exists(edited_pdf):
-            os.remove(edited_pdf)
+        # Wait for the font index prefetch before its directories are removed
+        self.editor.FontManager._get_font_index()
+        self.editor.close()
+        # Clean up the test PDF and any edited PDFs that might have been created
+        shutil.rmtree(self.temp_dir)
 
     def create_test_pdf(self):
         """Create a test PDF file with some sample text."""
@@ -31,11 +47,298 @@ class TestPDFEditor(unittest.TestCase):
         c.drawString(100, 750, "This is a test PDF file. It might contain sensitive information.")
         c.drawString(100, 700, "It contains multiple lines of text.")
         c.drawString(100, 650, "This sensitive information can be edited using PDFEditor")
+        c.setFillColorRGB(1, 0, 0)
+        c.drawString(100, 600, "Red text")
         c.save()
 
+    def get_text(self, pdf_path):
+        with fitz.open(pdf_path) as doc:
+            return doc[0].get_text()
+
+    def test_edit_base14_text_keeps_size_and_baseline(self):
+        self.editor.open_pdf(self.test_pdf_path)
+        page = self.editor.current_pdf[0]
+        text_instances = sorted(page.search_for("sensitive"), key=lambda rect: (rect.y0, rect.x0))
+        original_spans = self.editor.match_spans(text_instances, self.editor.get_page_spans(page))
+        properties = self.editor.get_span_properties(original_spans[0], text_instances[0])
+        self.assertEqual(properties['font'], 'helv')
+        
+        self.assertTrue(self.editor.edit_text(0, "sensitive", "private"))
+        
+        text = self.get_text(self.test_pdf_path.replace('.pdf', '_edited.pdf'))
+        self.assertNotIn("sensitive", text)
+        self.assertEqual(text.count("private"), 2)
+        
+        # The replacements keep the original font size and sit on the original baselines
+        with fitz.open(self.test_pdf_path.replace('.pdf', '_edited.pdf')) as doc:
+            new_spans = [span for _, span in self.editor.get_page_spans(doc[0]) if span['text'] == "private"]
+        self.assertEqual(len(new_spans), len(original_spans))
+        for inst, original, new in zip(text_instances, original_spans, new_spans):
+            self.assertEqual(new['font'], original['font'])
+            self.assertAlmostEqual(new['size'], original['size'])
+            self.assertAlmostEqual(new['origin'][0], inst.x0, delta=0.5)
+            self.assertAlmostEqual(new['origin'][1], original['origin'][1], delta=0.5)
+
+    def test_edit_keeps_text_color(self):
+        self.editor.open_pdf(self.test_pdf_path)
+        self.assertTrue(self.editor.edit_text(0, "Red", "Big"))
+        
+        with fitz.open(self.test_pdf_path.replace('.pdf', '_edited.pdf')) as doc:
+            spans = [span for _, span in self.editor.get_page_spans(doc[0]) if "Big" in span['text']]
+        self.assertEqual(len(spans), 1)
+        self.assertEqual(spans[0]['color'], 0xFF0000)
+
+    def test_find_font_only_remembers_lasting_results(self):
+        font_manager = self.editor.FontManager
+        with mock.patch.object(font_manager, "find_font", return_value=None) as find_font:
+            # A failure that may be temporary is retried on the next lookup
+            with mock.patch.object(font_manager, "_is_known_missing", return_value=False):
+                self.assertIsNone(self.editor.find_font("Roboto"))
+                self.assertIsNone(self.editor.find_font("Roboto"))
+            self.assertEqual(find_font.call_count, 2)
+            
+            # A font Google Fonts reported missing is not looked up again
+            with mock.patch.object(font_manager, "_is_known_missing", return_value=True):
+                self.assertIsNone(self.editor.find_font("Not A Font"))
+                self.assertIsNone(self.editor.find_font("Not A Font"))
+            self.assertEqual(find_font.call_count, 3)
+        
+        with mock.patch.object(font_manager, "find_font", return_value="/fonts/Lato.ttf") as find_font:
+            self.assertEqual(self.editor.find_font("Lato"), "/fonts/Lato.ttf")
+            self.assertEqual(self.editor.find_font("Lato"), "/fonts/Lato.ttf")
+        find_font.assert_called_once()
+
+    def test_incremental_edit_after_full_save(self):
+        self.editor.open_pdf(self.test_pdf_path)
+        self.assertTrue(self.editor.edit_text(0, "This", "That"))
+        self.assertTrue(self.editor.save_pdf(os.path.join(self.temp_dir, "copy.pdf")))
+        self.assertTrue(self.editor.edit_text(0, "multiple", "several", incremental=True))
+        
+        # The original file gets both edits appended and keeps the rest of its text
+        text = self.get_text(self.test_pdf_path)
+        self.assertNotIn("This", text)
+        self.assertNotIn("multiple", text)
+        self.assertEqual(text.count("That"), 2)
+        self.assertIn("several", text)
+        self.assertIn("is a test PDF file.", text)
+        self.assertIn("lines of text.", text)
+        self.assertIn("sensitive information can be edited", text)
+        self.assertIn("Red text", text)
+
+    def test_match_spans(self):
+        spans = [
+            # Sorted top to bottom, as returned by get_page_spans
+            (fitz.Rect(0, 0, 100, 12), 'first line'),
+            (fitz.Rect(200, 0, 220, 100), 'tall'),
+            (fitz.Rect(0, 10, 50, 22), 'second line left'),
+            (fitz.Rect(50, 10, 100, 22), 'second line right'),
+            (fitz.Rect(0, 30, 100, 42), 'third line'),
+        ]
+        cases = [
+            # Overlaps the first and second lines, mostly the first
+            (fitz.Rect(1, 1, 5, 11), 'first line'),
+            # Starts on a lower line than the tall span but still overlaps it
+            (fitz.Rect(201, 5, 210, 15), 'tall'),
+            (fitz.Rect(10, 11, 20, 21), 'second line left'),
+            (fitz.Rect(60, 11, 70, 21), 'second line right'),
+            (fitz.Rect(205, 60, 210, 70), 'tall'),
+            (fitz.Rect(5, 31, 9, 41), 'third line'),
+            # Doesn't intersect any span
+            (fitz.Rect(0, 50, 1, 51), None),
+        ]
+        text_instances = sorted((inst for inst, _ in cases), key=lambda rect: (rect.y0, rect.x0))
+        expected = {tuple(inst): span for inst, span in cases}
+        
+        matches = self.editor.match_spans(text_instances, spans)
+        self.assertEqual(matches, [expected[tuple(inst)] for inst in text_instances])
+        self.assertEqual(self.editor.match_spans([], spans), [])
+        self.assertEqual(self.editor.match_spans(text_instances[:1], []), [None])
+
+class TestFontManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.font_dir = os.path.join(self.temp_dir, "fonts")
+        os.makedirs(self.font_dir)
+        
+        # Keep the index cache out of the user's cache directory
+        env_patch = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(self.temp_dir, "cache")})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        dirs_patch = mock.patch.object(FontManager, "get_system_font_dirs", return_value=[self.font_dir])
+        dirs_patch.start()
+        self.addCleanup(dirs_patch.stop)
+        self.reset_font_state()
+
+    def tearDown(self):
+        self.reset_font_state()
+        shutil.rmtree(self.temp_dir)
+
+    def reset_font_state(self):
+        """Forget the index shared between instances, as a new process would."""
+        FontManager._font_index = None
+        FontManager._font_index_mtimes = None
+        FontManager._missing = {}
+
+    def add_font(self, *path_parts):
+        font_path = os.path.join(self.font_dir, *path_parts)
+        os.makedirs(os.path.dirname(font_path), exist_ok=True)
+        with open(font_path, "wb"):
+            pass
+        return font_path
+
+    def test_index_round_trip(self):
+        roboto = self.add_font("truetype", "Roboto-Regular.ttf")
+        self.assertEqual(FontManager(prefetch=False).find_font_in_system("Roboto"), roboto)
+        
+        # A new process loads the saved index instead of walking the directories
+        self.reset_font_state()
+        font_manager = FontManager(prefetch=False)
+        with mock.patch.object(FontManager, "_build_index") as build_index:
+            self.assertEqual(font_manager.find_font_in_system("Roboto"), roboto)
+        build_index.assert_not_called()
+
+    def test_font_installed_in_new_subdirectory(self):
+        self.add_font("truetype", "Roboto-Regular.ttf")
+        self.assertIsNone(FontManager(prefetch=False).find_font_in_system("Lato"))
+        
+        # Installing into a new subdirectory only changes the mtime of "truetype"
+        root_mtime = os.stat(self.font_dir).st_mtime
+        lato = self.add_font("truetype", "lato", "Lato-Regular.ttf")
+        os.utime(self.font_dir, (root_mtime, root_mtime))
+        
+        self.reset_font_state()
+        self.assertEqual(FontManager(prefetch=False).find_font_in_system("Lato"), lato)
+
+    def test_lookup_only_checks_font_directories(self):
+        for i in range(20):
+            self.add_font(f"family{i}", f"Font{i}-Regular.ttf")
+        font_manager = FontManager(prefetch=False)
+        font_manager.find_font_in_system("Font0")
+        
+        # Once the index is loaded, a lookup stats the font directory but not its subdirectories
+        with mock.patch("os.stat", wraps=os.stat) as stat:
+            self.assertIsNotNone(font_manager.find_font_in_system("Font19"))
+        self.assertEqual([call.args[0] for call in stat.call_args_list], [self.font_dir])
+
+    def test_missing_font_is_remembered(self):
+        font_manager = FontManager(prefetch=False)
+        font_manager._session = mock.Mock()
+        font_manager._session.get.return_value = mock.Mock(status_code=400)
+        self.assertIsNone(font_manager.find_font("Not A Font"))
+        
+        # Later lookups, even from a new process, skip the request
+        self.reset_font_state()
+        font_manager = FontManager(prefetch=False)
+        font_manager._session = mock.Mock()
+        self.assertIsNone(font_manager.find_font("Not A Font"))
+        font_manager._session.get.assert_not_called()
+        
+        # and, once the index is loaded, don't check the font directories either
+        with mock.patch("os.stat", wraps=os.stat) as stat:
+            self.assertIsNone(font_manager.find_font("Not A Font"))
+        stat.assert_not_called()
+        
+        # Until the entry expires
+        with mock.patch("pdf_edit.FontManager.time.time", return_value=time.time() + 8 * 24 * 60 * 60):
+            font_manager.find_font("Not A Font")
+        font_manager._session.get.assert_called_once()
+
+    def test_failed_requests_are_not_remembered(self):
+        font_manager = FontManager(prefetch=False)
+        font_manager._session = mock.Mock()
+        font_manager._session.get.side_effect = requests.ConnectionError()
+        self.assertEqual(font_manager.find_fonts(["Roboto"]), {"Roboto": None})
+        font_manager._session.get.side_effect = None
+        font_manager._session.get.return_value = mock.Mock(status_code=503)
+        self.assertIsNone(font_manager.find_font("Open Sans"))
+        
+        self.assertFalse(font_manager._is_known_missing("Roboto"))
+        self.assertFalse(font_manager._is_known_missing("Open Sans"))
+
+    def fake_google_fonts(self, available):
+        """Build a session.get replacement serving the given font families."""
+        def get(url, stream=False):
+            if url.startswith("https://fonts.googleapis.com/"):
+                family = url.split("family=")[1].replace("+", " ")
+                if family not in available:
+                    return mock.Mock(status_code=400)
+                css = f"src: url(https://fonts.gstatic.com/{family.replace(' ', '')}.ttf);"
+                return mock.Mock(status_code=200, text=css)
+            response = mock.MagicMock(status_code=200, headers={"Content-Type": "font/ttf"})
+            response.__enter__.return_value = response
+            response.raw.read.side_effect = [b"font data", b""]
+            return response
+        return get
+
+    def test_download_keeps_index_and_missing_fonts(self):
+        self.add_font("Roboto-Regular.ttf")
+        font_manager = FontManager(prefetch=False)
+        font_manager._session = mock.Mock()
+        font_manager._session.get.side_effect = self.fake_google_fonts({"Lato"})
+        
+        with mock.patch.object(FontManager, "get_font_save_directory", return_value=self.font_dir):
+            results = font_manager.find_fonts(["Not A Font", "Lato"])
+        self.assertIsNone(results["Not A Font"])
+        self.assertEqual(results["Lato"], os.path.join(self.font_dir, "Lato.ttf"))
+        
+        # Saving the download doesn't trigger a new walk or forget the missing font
+        font_manager._session.get.reset_mock()
+        with mock.patch.object(FontManager, "_build_index") as build_index:
+            self.assertIsNone(font_manager.find_font("Not A Font"))
+            self.assertEqual(font_manager.find_font("Lato"), results["Lato"])
+        build_index.assert_not_called()
+        font_manager._session.get.assert_not_called()
+
+    def test_installed_font_is_no_longer_missing(self):
+        font_manager = FontManager(prefetch=False)
+        font_manager._session = mock.Mock()
+        font_manager._session.get.return_value = mock.Mock(status_code=400)
+        font_manager.find_font("Lato")
+        font_manager.find_font("Not A Font")
+        
+        # The next lookup that checks the font directories rebuilds the index,
+        # dropping the fonts it now finds from the missing list
+        lato = self.add_font("lato", "Lato-Regular.ttf")
+        font_manager.find_font_in_system("Roboto")
+        self.assertEqual(font_manager.find_font("Lato"), lato)
+        self.assertTrue(font_manager._is_known_missing("Not A Font"))
+
+    def test_extract_font_url_prefers_embeddable_formats(self):
+        font_manager = FontManager(prefetch=False)
+        css = """
+        @font-face { src: url(https://fonts.gstatic.com/a.woff2) format('woff2'); }
+        @font-face { src: url('https://fonts.gstatic.com/b.woff') format('woff'),
+                          url("https://fonts.gstatic.com/c.ttf") format('truetype'),
+                          url(https://fonts.gstatic.com/d.ttf) format('truetype'); }
+        """
+        self.assertEqual(font_manager._extract_font_url(css), "https://fonts.gstatic.com/c.ttf")
+        self.assertEqual(
+            font_manager._extract_font_url("src: url(https://fonts.gstatic.com/a.woff2?v=1);"),
+            "https://fonts.gstatic.com/a.woff2?v=1"
+        )
+        self.assertIsNone(font_manager._extract_font_url("body { color: red; }"))
+
+    def test_mark_missing_waits_for_index_updates(self):
+        font_manager = FontManager(prefetch=False)
+        font_manager._get_font_index()
+        
+        # While another thread updates the index, marking a font has to wait
+        with FontManager._index_lock:
+            thread = threading.Thread(target=font_manager._mark_missing, args=(["Not A Font"],))
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+            FontManager._missing = {}
+        thread.join()
+        
+        self.assertTrue(font_manager._is_known_missing("Not A Font"))
+        with open(font_manager.cache_path, encoding="utf-8") as f:
+            self.assertIn("notafont", json.load(f)["missing"])
+
+
 if __name__ == '__main__':
     test = TestPDFEditor()
     test.setUp()
-    test.editor.open_pdf("examples/example.pdf")
+    test.editor.open_pdf(test.test_pdf_path)
     test.editor.set_verbose(True)
     test.editor.edit_text(0, "sensitive", "redacted")
\ No newline at end of file